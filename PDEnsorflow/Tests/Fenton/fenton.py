@@ -25,6 +25,8 @@
 
 import numpy as np
 import time
+import queue
+import threading
 from  gpuSolve.IO.writers import ResultWriter
 try:
   import vedo 
@@ -37,7 +39,6 @@ except:
 
 
 import tensorflow as tf
-tf.config.run_functions_eagerly(True)
 if(tf.config.list_physical_devices('GPU')):
       print('GPU device' )
 else:
@@ -46,20 +47,14 @@ print('Tensorflow version is: {0}'.format(tf.__version__))
 
 from gpuSolve.ionic.fenton4v import *
 from gpuSolve.entities.domain3D import Domain3D
-from gpuSolve.diffop3D import laplace_homog as laplace
 from gpuSolve.diffop3D import laplace_conv_homog as conv_laplace
 from gpuSolve.force_terms import Stimulus
 
-
-@tf.function
-def enforce_boundary(X):
-    """
-        Enforcing the no-flux (Neumann) boundary condition
-    """
-    padmode = 'symmetric'
-    paddings = tf.constant([[1,1], [1,1], [1,1]])
-    return( tf.pad(X[1:-1,1:-1,1:-1], paddings=paddings,mode=padmode,name='boundary' ) )
-
+try:
+    from gpuSolve.ionic.fenton_kernel import fenton_step, fenton_step_block
+    has_fenton_kernel = True
+except ImportError:
+    has_fenton_kernel = False
 
 
 class Fenton4vSimple(Fenton4v):
@@ -74,6 +69,9 @@ class Fenton4vSimple(Fenton4v):
         self.dt          = 0.1
         self.diff        = 1.0
         self.convl       = False
+        self.numba       = False
+        self.tblock      = 1
+        self.bf16        = False
         self.samples     = 10000
         self.s2_time     = 200
         self.dt_per_plot = 10
@@ -82,11 +80,30 @@ class Fenton4vSimple(Fenton4v):
             if attribute in props.keys():
                 setattr(self, attribute, props[attribute])
 
+        # bfloat16 state halves the memory traffic of the bandwidth-bound
+        # stencil; the arithmetic is still performed in float32 within solve.
+        # Caveat: the per-step round-back quantizes away updates smaller than
+        # half an ulp of the stored value, which stalls the slow v/w gates
+        # near 1.0 and changes the model dynamics, so it is off by default
+        if self.bf16:
+            self.state_dtype = tf.bfloat16
+        else:
+            self.state_dtype = tf.float32
+
         then = time.time()
         self._domain.load_geometry_file()
         self.DX = self._domain.DX()
         self.DY = self._domain.DY()
         self.DZ = self._domain.DZ()
+        # specialise the traced step for the exact grid shape: XLA compiles
+        # with compile-time constant bounds and the graph can never retrace
+        state_spec = tf.TensorSpec([4, self._domain.width(), self._domain.height(), self._domain.depth()],
+                                   self.state_dtype)
+        stim_spec  = tf.TensorSpec([self._domain.width(), self._domain.height(), self._domain.depth()],
+                                   tf.float32)
+        self.solve = tf.function(self._solve,
+                                 input_signature=[state_spec, tf.TensorSpec([], tf.bool), stim_spec],
+                                 jit_compile=True)
         elapsed = (time.time() - then)
         tf.print('initialisation, elapsed: %f sec' % elapsed)
         self.tinit = elapsed
@@ -95,26 +112,124 @@ class Fenton4vSimple(Fenton4v):
         return(self._domain.geometry())
 
 
-    @tf.function
-    def solve(self, state):
-        """ Explicit Euler ODE solver """
-        U, V, W, S = state
-        U0 = enforce_boundary(U)
+    def _solve(self, state, apply_stim, stim):
+        """ Explicit Euler ODE solver; the boundary condition, the Laplace
+            operator, the ionic update and the stimulus (gated by the scalar
+            apply_stim) are inlined so that XLA compiles the whole step into
+            a single fused kernel.
+            The state variables are packed in a single [4,width,height,depth]
+            tensor (U,V,W,S along the first axis) so that the hot loop works
+            on one contiguous arena.
+            The state may be stored in bfloat16; the step is computed with
+            float32 accumulation and cast back on write """
+        U = tf.cast(state[0], tf.float32)
+        V = tf.cast(state[1], tf.float32)
+        W = tf.cast(state[2], tf.float32)
+        S = tf.cast(state[3], tf.float32)
         dU, dV, dW, dS = self.differentiate(U, V, W, S)
         if self.convl:
-            U1 = U0 + self.dt * dU + self.diff * self.dt * conv_laplace(U0,self.DX,self.DY,self.DZ)
+            U1 = U + self.dt * dU + self.diff * self.dt * conv_laplace(U,self.DX,self.DY,self.DZ)
         else:
-            U1 = U0 + self.dt * dU + self.diff * self.dt * laplace(U0,self.DX,self.DY,self.DZ)
+            # neighbours with the index clamped at the borders enforce the
+            # no-flux boundary without materialising a padded copy
+            Uxm = tf.concat([U[:1,:,:],  U[:-1,:,:]], axis=0)
+            Uxp = tf.concat([U[1:,:,:],  U[-1:,:,:]], axis=0)
+            Uym = tf.concat([U[:,:1,:],  U[:,:-1,:]], axis=1)
+            Uyp = tf.concat([U[:,1:,:],  U[:,-1:,:]], axis=1)
+            Uzm = tf.concat([U[:,:,:1],  U[:,:,:-1]], axis=2)
+            Uzp = tf.concat([U[:,:,1:],  U[:,:,-1:]], axis=2)
+            lapla = ((Uxm - 2.0*U + Uxp)/(self.DX*self.DX)
+                  +  (Uym - 2.0*U + Uyp)/(self.DY*self.DY)
+                  +  (Uzm - 2.0*U + Uzp)/(self.DZ*self.DZ))
+            U1 = U + self.dt * dU + self.diff * self.dt * lapla
+        U1 = tf.where(apply_stim, tf.maximum(U1, stim), U1)
         V1 = V + self.dt * dV
         W1 = W + self.dt * dW
         S1 = S + self.dt * dS
-        return U1, V1, W1, S1
+        return tf.cast(tf.stack([U1, V1, W1, S1]), self.state_dtype)
+
+
+    def run_numba(self, im=None):
+        """
+            Runs the model with the fused Numba CPU kernel.
+
+            Args:
+                im: A Screen/writer used to paint/write the transmembrane potential
+
+            Returns:
+                None
+        """
+        if self.convl:
+            print('Warning: the numba kernel uses the built-in 7-point stencil; convl is ignored',flush=True)
+
+        width  = self._domain.width()
+        height = self._domain.height()
+        depth  = self._domain.depth()
+
+        # the initial values of the state variables
+        # initial values (u, v, w, s) = (0.0, 1.0, 1.0, 0.0)
+        U  = np.full([width,height,depth], self.min_v, dtype=np.float32)
+        s2_init = np.full([width,height,depth], self.min_v, dtype=np.float32)
+        U[0:2,:,:] = self.max_v
+        s2_init[:width//2,:height//2,:] = self.max_v
+        V = np.full([width,height,depth], 1.0, dtype=np.float32)
+        W = np.full([width,height,depth], 1.0, dtype=np.float32)
+        S = np.full([width,height,depth], 0.0, dtype=np.float32)
+        U1 = np.empty_like(U)
+        V1 = np.empty_like(V)
+        W1 = np.empty_like(W)
+        S1 = np.empty_like(S)
+
+        #define a source that is triggered at t=s2_time: : vertical (2D) along the left face
+        s2 = Stimulus({'tstart': self.s2_time,
+                       'nstim': 1,
+                       'period':800,
+                       'duration':self.dt,
+                       'dt': self.dt,
+                       'intensity':self.max_v})
+        s2.set_stimregion(s2_init)
+        stim = s2().numpy()
+        s2_init=[]
+        dx = self.DX.numpy()
+        dy = self.DY.numpy()
+        dz = self.DZ.numpy()
+        # precompute the stimulation schedule, so that blocked sweeps can
+        # look ahead and never step across a firing time
+        stim_sched = np.array([s2.stimulate_tissue_timestep(i,self.dt) for i in range(self.samples)])
+        tblock = max(1, int(self.tblock))
+        tile   = 32
+        then = time.time()
+        i = 0
+        while i < self.samples:
+            # advance up to tblock steps in one temporally-blocked sweep,
+            # without crossing a plot frame or an intermediate stimulus step
+            n = min(tblock, self.dt_per_plot - i % self.dt_per_plot, self.samples - i)
+            while n > 1 and stim_sched[i:i+n-1].any():
+                n -= 1
+            if n > 1:
+                fenton_step_block(U, V, W, S, self.diff, dx, dy, dz, self.dt, n, tile, U1, V1, W1, S1)
+            else:
+                fenton_step(U, V, W, S, self.diff, dx, dy, dz, self.dt, U1, V1, W1, S1)
+            U, U1 = U1, U
+            V, V1 = V1, V
+            W, W1 = W1, W
+            S, S1 = S1, S
+            i += n
+            if stim_sched[i-1]:
+                np.maximum(U, stim, out=U)
+            # draw a frame every 1 ms
+            if im and i % self.dt_per_plot == 0:
+                im.imshow(U)
+        elapsed = (time.time() - then)
+        print('solution, elapsed: %f sec' % elapsed)
+        print('TOTAL, elapsed: %f sec' % (elapsed+self.tinit))
+        if im:
+            im.wait()   # wait until the window is closed
 
 
-    @tf.function
     def run(self, im=None):
         """
-            Runs the model. 
+            Runs the model.
 
             Args:
                 im: A Screen/writer used to paint/write the transmembrane potential
@@ -122,6 +237,14 @@ class Fenton4vSimple(Fenton4v):
             Returns:
                 None
         """
+        if self.numba:
+            if not has_fenton_kernel:
+                print('Warning: no numba kernel available; using the tensorflow solver',flush=True)
+            elif tf.config.list_physical_devices('GPU'):
+                print('Warning: numba requested but a GPU is present; using the tensorflow solver',flush=True)
+            else:
+                return(self.run_numba(im))
+
         width  = self._domain.width()
         height = self._domain.height()
         depth  = self._domain.depth()
@@ -133,12 +256,15 @@ class Fenton4vSimple(Fenton4v):
         u_init[0:2,:,:] = self.max_v
         s2_init[:width//2,:height//2,:] = self.max_v
         then = time.time()
-        U = tf.Variable(u_init, name="U" )
-        V = tf.Variable(np.full([width,height,depth], 1.0, dtype=np.float32), name="V"    )
-        W = tf.Variable(np.full([width,height,depth], 1.0, dtype=np.float32), name="W"    )
-        S = tf.Variable(np.full([width,height,depth], 0.0, dtype=np.float32), name="S"    )
+        # the state variables, packed SoA-style in one contiguous tensor;
+        # a plain tensor (not a Variable) since the loop rebinds it anyway.
+        # v, w and s are constant-filled on device (no host array round-trip)
+        state = tf.cast(tf.stack([tf.convert_to_tensor(u_init),
+                                  tf.ones([width,height,depth], tf.float32),
+                                  tf.ones([width,height,depth], tf.float32),
+                                  tf.zeros([width,height,depth], tf.float32)]), self.state_dtype)
         elapsed = (time.time() - then)
-        tf.print('U,V,W,S variables, elapsed: %f sec' % elapsed)
+        tf.print('state tensor, elapsed: %f sec' % elapsed)
         self.tinit = self.tinit + elapsed
         u_init=[]
 
@@ -157,21 +283,51 @@ class Fenton4vSimple(Fenton4v):
         tf.print('total initialization: %f sec' % self.tinit)
         
         s2_init=[]
+        # precompute the stimulation schedule once: the graph then gates the
+        # stimulus with a branchless lookup instead of per-step time tests
+        stim_sched = tf.constant(np.array([s2.stimulate_tissue_timestep(i,self.dt) for i in range(self.samples)]), dtype=tf.bool)
+        stim       = s2()
+
+        @tf.function(jit_compile=True)
+        def step_block(state, i0, n):
+            """ Advances the solution of n time steps in a single graph call """
+            def body(i, state):
+                # the stimulus is applied inside solve, so the whole step
+                # (including the gated tf.maximum) stays one fused kernel
+                return i + 1, self.solve(state, stim_sched[i], stim)
+
+            def cond(i, state):
+                return i < i0 + n
+
+            _, state = tf.while_loop(cond, body, [i0, state],
+                                     parallel_iterations=1)
+            return state
+
+        if im:
+            # write the frames from a background thread, so the solver can
+            # run ahead while the previous snapshots are being rendered
+            frames = queue.Queue(maxsize=4)
+            def write_frames():
+                while True:
+                    frame = frames.get()
+                    if frame is None:
+                        break
+                    im.imshow(frame)
+            plotter = threading.Thread(target=write_frames)
+            plotter.start()
+
         then = time.time()
-        for i in tf.range(self.samples):
-            state = [U, V, W, S]
-            U1, V1, W1, S1 = self.solve(state)
-            U = U1
-            V = V1
-            W = W1
-            S = S1
-            #if s2.stimulate_tissue_timevalue(float(i)*self.dt):
-            if s2.stimulate_tissue_timestep(i,self.dt):
-                U = tf.maximum(U, s2())
-            # draw a frame every 1 ms
-            if im and i % self.dt_per_plot == 0:
-                image = U.numpy()
-                im.imshow(image)
+        for i in range(0, self.samples, self.dt_per_plot):
+            state = step_block(state, tf.constant(i), self.dt_per_plot)
+            # draw a frame every 1 ms; the frame is quantized to uint8 on
+            # device, so the device-to-host copy is 4x smaller
+            if im:
+                snap = (tf.cast(state[0], tf.float32) - self.min_v)/(self.max_v - self.min_v)
+                snap = tf.cast(255.0*tf.clip_by_value(snap, 0.0, 1.0), tf.uint8)
+                frames.put(snap.numpy())
+        if im:
+            frames.put(None)
+            plotter.join()
         elapsed = (time.time() - then)
         print('solution, elapsed: %f sec' % elapsed)
         print('TOTAL, elapsed: %f sec' % (elapsed+self.tinit))
@@ -194,7 +350,13 @@ if __name__ == '__main__':
         'diff': 0.8,
         'samples': 10000,
         's2_time': 200,
-         'convl': False
+         'convl': False,
+         'numba': False,
+         'tblock': 4,
+         # bf16 halves the memory traffic but its ~2e-3 resolution near 1.0
+         # swallows the slow-gate increments (dW*dt ~ 6e-4), freezing v and w:
+         # enable it only when that loss of dynamics is acceptable
+         'bf16' : False
     }
 
     print('config:')
@@ -25,6 +25,8 @@
 
 import numpy as np
 import time
+import queue
+import threading
 from  gpuSolve.IO.writers import ResultWriter
 
 try:
@@ -38,7 +40,6 @@ except:
 
 
 import tensorflow as tf
-tf.config.run_functions_eagerly(True)
 if(tf.config.list_physical_devices('GPU')):
       print('GPU device' )
 else:
@@ -46,20 +47,18 @@ else:
 print('Tensorflow version is: {0}'.format(tf.__version__))
 
 from gpuSolve.ionic.fenton4v import *
+from gpuSolve.ionic import fenton4v_np
 from gpuSolve.entities.domain3D import Domain3D
 from gpuSolve.diffop3D import laplace_heterog as laplace
 from gpuSolve.force_terms import Stimulus
 
-
-@tf.function
-def enforce_boundary(X):
-    """
-        Enforcing the no-flux (Neumann) boundary condition
-    """
-    padmode = 'symmetric'
-    paddings = tf.constant([[1,1], [1,1], [1,1]])
-    return( tf.pad(X[1:-1,1:-1,1:-1], paddings=paddings,mode=padmode,name='boundary' ) )
-
+# the SIMD C stencil is optional: importing it compiles the shared
+# library and fails when no C compiler is available
+try:
+    from gpuSolve.diffop3D.laplace_cext import laplace_heterog_cext
+    has_laplace_cext = True
+except Exception:
+    has_laplace_cext = False
 
 
 class Fenton4vSimple(Fenton4v):
@@ -81,6 +80,7 @@ class Fenton4vSimple(Fenton4v):
         self.radius      = 1.0
         self.hole        = False
         self.cylindric   = False
+        self.cext        = False
 
         for attribute in self.__dict__.keys():
             if attribute in props.keys():
@@ -111,7 +111,10 @@ class Fenton4vSimple(Fenton4v):
             img_vox = (distsq<=(self.radius*self.radius)).astype(np.float32)
             
         self._domain.assign_geometry(img_vox)
-        self._domain.assign_conductivity(self.diff*img_vox) 
+        self._domain.assign_conductivity(self.diff*img_vox)
+        # cache the domain mask once; it is reused for the initial state,
+        # the stimulus region and every plotted frame
+        self._mask = tf.constant(self.domain().numpy() > 0.0, name='mask')
         elapsed = (time.time() - then)
         self.tinit += elapsed
         tf.print('initialisation,elapsed: %f sec' % elapsed)
@@ -121,22 +124,92 @@ class Fenton4vSimple(Fenton4v):
 
 
     @tf.function
-    def solve(self, state):
+    def solve(self, U, V, W, S):
         """ Explicit Euler ODE solver """
-        U, V, W, S = state
-        U0 = enforce_boundary(U)
         dU, dV, dW, dS = self.differentiate(U, V, W, S)
-        U1 = U0 + self.dt * dU + self.dt * laplace(U0,self._domain.conductivity(),self.DX,self.DY,self.DZ)
+        U1 = U + self.dt * dU + self.dt * laplace(U,self._domain.conductivity(),self.DX,self.DY,self.DZ)
         V1 = V + self.dt * dV
         W1 = W + self.dt * dW
         S1 = S + self.dt * dS
         return U1, V1, W1, S1
 
 
-    @tf.function
+    def run_cext(self, im=None):
+        """
+            Runs the model on the CPU with the SIMD C Laplace kernel.
+            The state lives in numpy arrays: the diffusion term goes
+            through laplace_heterog_cext and the ionic update is the
+            vectorised numpy model of fenton4v_np.
+
+            Args:
+                im: A Screen/writer used to paint/write the transmembrane potential
+
+            Returns:
+                None
+        """
+        width  = self._domain.width()
+        height = self._domain.height()
+        depth  = self._domain.depth()
+
+        # the initial values of the state variables
+        # initial values (u, v, w, s) = (0.0, 1.0, 1.0, 0.0)
+        u_init  = np.full([width,height,depth], self.min_v, dtype=np.float32)
+        s2_init = np.full([width,height,depth], self.min_v, dtype=np.float32)
+
+        if self.hole:
+            # first stimulus on one side; second stimulus on a brick
+            u_init[0:2,:,:] = self.max_v
+            s2_init[:width//2,:height//2,:] = self.max_v
+        else:
+            u_init[(width//2-10):(width//2+10),:,:]    = self.max_v
+            s2_init[:,(height//2-10):(height//2+10),:] = self.max_v
+
+        mask = self._mask.numpy()
+        U = np.where(mask, u_init, self.min_v).astype(np.float32)
+        V = np.ones([width,height,depth], dtype=np.float32)
+        W = np.ones([width,height,depth], dtype=np.float32)
+        S = np.zeros([width,height,depth], dtype=np.float32)
+
+        #define a source that is triggered at t=s2_time: : vertical (2D) along the left face
+        s2 = Stimulus({'tstart': self.s2_time,
+                       'nstim': 1,
+                       'period':800,
+                       'duration':self.dt,
+                       'dt': self.dt,
+                       'intensity':self.max_v})
+        s2.set_stimregion(np.where(mask, s2_init, self.min_v))
+        stim = s2().numpy()
+        s2_init=[]
+        stim_sched = np.array([s2.stimulate_tissue_timestep(i,self.dt) for i in range(self.samples)])
+        cond = self._domain.conductivity().numpy()
+        dx = self.DX.numpy()
+        dy = self.DY.numpy()
+        dz = self.DZ.numpy()
+
+        then = time.time()
+        for i in range(self.samples):
+            lapla = laplace_heterog_cext(U, cond, dx, dy, dz)
+            dU, dV, dW, dS = fenton4v_np.differentiate(U, V, W, S)
+            U += self.dt*dU
+            U += self.dt*lapla
+            V += self.dt*dV
+            W += self.dt*dW
+            S += self.dt*dS
+            if stim_sched[i]:
+                np.maximum(U, stim, out=U)
+            # draw a frame every 1 ms
+            if im and (i+1) % self.dt_per_plot == 0:
+                im.imshow(np.where(mask, U, -1.0))
+        elapsed = (time.time() - then)
+        print('solution, elapsed: %f sec' % elapsed)
+        print('TOTAL, elapsed: %f sec' % (elapsed+self.tinit))
+        if im:
+            im.wait()   # wait until the window is closed
+
+
     def run(self, im=None):
         """
-            Runs the model. 
+            Runs the model.
 
             Args:
                 im: A Screen/writer used to paint/write the transmembrane potential
@@ -144,7 +217,15 @@ class Fenton4vSimple(Fenton4v):
             Returns:
                 None
         """
-        width  = self._domain.width()        
+        if self.cext:
+            if not has_laplace_cext:
+                print('Warning: no C stencil kernel available; using the tensorflow solver',flush=True)
+            elif tf.config.list_physical_devices('GPU'):
+                print('Warning: cext requested but a GPU is present; using the tensorflow solver',flush=True)
+            else:
+                return(self.run_cext(im))
+
+        width  = self._domain.width()
         height = self._domain.height()
         depth  = self._domain.depth()
 
@@ -162,13 +243,15 @@ class Fenton4vSimple(Fenton4v):
             s2_init[:,(height//2-10):(height//2+10),:] = self.max_v            
 
         then = time.time()
-        U = tf.Variable(u_init, name="U" )
-        U = tf.where(self.domain()>0.0, U, self.min_v)
-        V = tf.Variable(np.full([width,height,depth], 1.0, dtype=np.float32), name="V"    )
-        W = tf.Variable(np.full([width,height,depth], 1.0, dtype=np.float32), name="W"    )
-        S = tf.Variable(np.full([width,height,depth], 0.0, dtype=np.float32), name="S"    )
+        # plain tensors (not Variables): the loop rebinds them every step,
+        # so resource-variable read ops would only add overhead.
+        # v, w and s are constant-filled on device (no host array round-trip)
+        U = tf.where(self._mask, tf.convert_to_tensor(u_init), self.min_v)
+        V = tf.ones([width,height,depth], tf.float32)
+        W = tf.ones([width,height,depth], tf.float32)
+        S = tf.zeros([width,height,depth], tf.float32)
         elapsed = (time.time() - then)
-        tf.print('U,V,W,S variables, elapsed: %f sec' % elapsed)
+        tf.print('U,V,W,S tensors, elapsed: %f sec' % elapsed)
         self.tinit = self.tinit + elapsed
         u_init=[]
 
@@ -180,28 +263,56 @@ class Fenton4vSimple(Fenton4v):
                        'duration':self.dt,
                        'dt': self.dt,
                        'intensity':self.max_v})
-        s2.set_stimregion(np.where(self.domain().numpy()>0.0, s2_init, self.min_v))
+        s2.set_stimregion(np.where(self._mask.numpy(), s2_init, self.min_v))
         elapsed = (time.time() - then)
         tf.print('s2 tensor, elapsed: %f sec' % elapsed)
         self.tinit = self.tinit + elapsed
         tf.print('total initialization: %f sec' % self.tinit)
         
         s2_init=[]
+        # precompute the stimulation schedule once: the graph then gates the
+        # stimulus with a branchless lookup instead of per-step time tests.
+        # The stimulus shape is time-invariant, so its tensor is cached too
+        stim_sched = tf.constant(np.array([s2.stimulate_tissue_timestep(i,self.dt) for i in range(self.samples)]), dtype=tf.bool)
+        stim = s2()
+
+        @tf.function
+        def step_block(U, V, W, S, i0, n):
+            """ Advances the solution of n time steps in a single graph call """
+            def body(i, U, V, W, S):
+                U1, V1, W1, S1 = self.solve(U, V, W, S)
+                U1 = tf.where(stim_sched[i], tf.maximum(U1, stim), U1)
+                return i + 1, U1, V1, W1, S1
+
+            def cond(i, U, V, W, S):
+                return i < i0 + n
+
+            _, U, V, W, S = tf.while_loop(cond, body, [i0, U, V, W, S],
+                                          parallel_iterations=1)
+            return U, V, W, S
+
+        if im:
+            # write the frames from a background thread, so the solver can
+            # run ahead while the previous snapshots are being rendered
+            frames = queue.Queue(maxsize=4)
+            def write_frames():
+                while True:
+                    frame = frames.get()
+                    if frame is None:
+                        break
+                    im.imshow(frame)
+            plotter = threading.Thread(target=write_frames)
+            plotter.start()
+
         then = time.time()
-        for i in tf.range(self.samples):
-            state = [U, V, W, S]
-            U1, V1, W1, S1 = self.solve(state)
-            U = U1
-            V = V1
-            W = W1
-            S = S1
-            #if s2.stimulate_tissue_timevalue(float(i)*self.dt):
-            if s2.stimulate_tissue_timestep(i,self.dt):
-                U = tf.maximum(U, s2())
+        for i in range(0, self.samples, self.dt_per_plot):
+            U, V, W, S = step_block(U, V, W, S, tf.constant(i), self.dt_per_plot)
             # draw a frame every 1 ms
-            if im and i % self.dt_per_plot == 0:
-                image = tf.where(self.domain()>0.0, U, -1.0).numpy()
-                im.imshow(image)                
+            if im:
+                frames.put(tf.where(self._mask, U, -1.0).numpy())
+        if im:
+            frames.put(None)
+            plotter.join()
         elapsed = (time.time() - then)
         print('solution, elapsed: %f sec' % elapsed)
         print('TOTAL, elapsed: %f sec' % (elapsed+self.tinit))
@@ -224,7 +335,8 @@ if __name__ == '__main__':
         'dt_per_plot' : 10,
         'diff': 0.8,
         'samples': 10000,
-        's2_time': 200
+        's2_time': 200,
+        'cext': False
     }
 
     print('config:')
@@ -30,10 +30,10 @@ class ResultWriter:
 
 
 
-    def initialise_cube(self):
+    def initialise_cube(self, dtype=np.float32):
         """Initialise the  cube to store results"""
         n                = int(self.samples//self.dt_per_plot)
-        self.cube        = np.full(shape=(n, self.width, self.height,  self.depth),fill_value=self.initval ,dtype=np.float32)
+        self.cube        = np.full(shape=(n, self.width, self.height,  self.depth),fill_value=self.initval ,dtype=dtype)
         self.counter     = 0
         self.cube_exists = True
         
@@ -51,8 +51,10 @@ class ResultWriter:
 
     def imshow(self,VolData):
         if not self.cube_exists:
-            self.initialise_cube()
-        
+            # store the frames with the dtype of the incoming data
+            # (e.g. uint8 when the driver quantizes the snapshots)
+            self.initialise_cube(np.asarray(VolData).dtype)
+
         self.cube[self.counter,:,:,:] = VolData
         self.counter = self.counter + 1
 
@@ -0,0 +1,38 @@
+"""
+cuda submodule of gpuSolve.
+This module contains the sources of the hand-written CUDA kernels and the
+loaders for the compiled custom-op libraries. The kernels must be compiled
+with nvcc against the installed tensorflow (see the README of this
+directory); the loaders raise tf.errors.NotFoundError when the compiled
+library is not present, so callers can fall back to the pure-tensorflow
+solvers.
+Contains:
+  * fenton_step.cu: fused Fenton 4v monodomain step (custom op FentonStep)
+
+"""
+import os
+import tensorflow as tf
+
+__version__=['1','1','0']
+
+
+def version():
+  verstr=''
+  for x in __version__:
+      verstr = verstr+'{}.'.format(x)
+  verstr=verstr=verstr[:-1]
+  return(verstr)
+
+
+def load_fenton_step_library(path=''):
+    '''
+    This function loads the compiled fenton_step custom-op library and
+    returns the op module; the op FentonStep takes a [W,H,D,4] float32
+    state tensor (u,v,w,s packed per voxel) and the diff/dx/dy/dz/dt
+    attributes, and returns the state after one fused Euler step.
+    Arguments:
+        path: the library file name (default: _fenton_step.so next to the sources)
+    '''
+    if not len(path):
+        path = os.path.join(os.path.dirname(__file__), '_fenton_step.so')
+    return(tf.load_op_library(path))
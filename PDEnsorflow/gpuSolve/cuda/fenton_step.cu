@@ -0,0 +1,210 @@
+/*
+ * fenton_step.cu
+ *
+ * Hand-written CUDA kernel for one fused explicit Euler step of the
+ * Fenton 4v monodomain model with homogeneous isotropic diffusion,
+ * registered as the tensorflow custom op "FentonStep".
+ *
+ * The state is packed as one float4 per voxel (u,v,w,s) on a
+ * C-contiguous [W,H,D] grid, i.e. a [W,H,D,4] float32 tensor. The
+ * kernel uses 2.5D tiling: each block covers a TY x TX tile of the
+ * (j,k) plane, keeps the u values of the current i plane in shared
+ * memory for the in-plane neighbours, and streams along i with the
+ * i-1/i/i+1 u values held in registers, so the state crosses global
+ * memory once per step (one read, one write). The no-flux (Neumann)
+ * boundary condition is obtained by clamping the neighbour indices,
+ * the same discretisation as gpuSolve.ionic.fenton_kernel.
+ *
+ * Build (adjust the tensorflow include/lib paths, see README.md):
+ *   TF_CFLAGS=$(python -c 'import tensorflow as tf; print(" ".join(tf.sysconfig.get_compile_flags()))')
+ *   TF_LFLAGS=$(python -c 'import tensorflow as tf; print(" ".join(tf.sysconfig.get_link_flags()))')
+ *   nvcc -O3 --use_fast_math -shared -Xcompiler -fPIC fenton_step.cu \
+ *        ${TF_CFLAGS} ${TF_LFLAGS} -DGOOGLE_CUDA=1 -o _fenton_step.so
+ */
+
+#define TX 32
+#define TY 8
+
+#define EIGEN_USE_GPU
+#include "tensorflow/core/framework/op.h"
+#include "tensorflow/core/framework/op_kernel.h"
+#include "tensorflow/core/framework/shape_inference.h"
+#include "tensorflow/core/util/gpu_kernel_helper.h"
+
+__device__ __forceinline__ float stepH(float x)
+{
+    return (x > 0.0f) ? 1.0f : ((x < 0.0f) ? 0.0f : 0.5f);
+}
+
+__device__ __forceinline__ float stepG(float x)
+{
+    return (x < 0.0f) ? 1.0f : ((x > 0.0f) ? 0.0f : 0.5f);
+}
+
+/* the Fenton 4v ionic update of one voxel, fused with the Euler step */
+__device__ __forceinline__ float4 fenton_voxel(float4 q, float lapla,
+                                               float diff, float dt)
+{
+    /* constants for the Fenton 4v left atrial action potential model */
+    const float tau_vp  = 3.33f;
+    const float tau_vn  = 19.2f;
+    const float tau_wp  = 160.0f;
+    const float tau_wn1 = 75.0f;
+    const float tau_wn2 = 75.0f;
+    const float tau_d   = 0.065f;
+    const float tau_si  = 31.8364f;
+    const float tau_so  = tau_si;
+    const float tau_a   = 0.009f;
+    const float u_c     = 0.23f;
+    const float u_w     = 0.146f;
+    const float u_0     = 0.0f;
+    const float u_m     = 1.0f;
+    const float u_csi   = 0.8f;
+    const float u_so    = 0.3f;
+    const float r_sp    = 0.02f;
+    const float r_sn    = 1.2f;
+    const float k_      = 3.0f;
+    const float a_so    = 0.115f;
+    const float b_so    = 0.84f;
+    const float c_so    = 0.02f;
+
+    const float u = q.x;
+    const float v = q.y;
+    const float w = q.z;
+    const float s = q.w;
+
+    const float I_fi = -v * stepH(u - u_c) * (u - u_c) * (u_m - u) / tau_d;
+    const float I_si = -w * s / tau_si;
+    const float I_so = 0.5f * (a_so - tau_a) * (1.0f + tanhf((u - b_so) / c_so))
+                     + (u - u_0) * stepG(u - u_so) / tau_so
+                     + stepH(u - u_so) * tau_a;
+    const float du = -(I_fi + I_si + I_so);
+    const float dv = (u > u_c) ? (-v / tau_vp) : ((1.0f - v) / tau_vn);
+    float dw;
+    if (u > u_c)
+        dw = -w / tau_wp;
+    else if (u > u_w)
+        dw = (1.0f - w) / tau_wn2;
+    else
+        dw = (1.0f - w) / tau_wn1;
+    const float r_s = (r_sp - r_sn) * stepH(u - u_c) + r_sn;
+    const float ds  = r_s * (0.5f * (1.0f + tanhf((u - u_csi) * k_)) - s);
+
+    float4 out;
+    out.x = u + dt*du + diff*dt*lapla;
+    out.y = v + dt*dv;
+    out.z = w + dt*dw;
+    out.w = s + dt*ds;
+    return out;
+}
+
+__global__ void fenton_step_kernel(const float4* __restrict__ in,
+                                   float4* __restrict__ out,
+                                   int W, int H, int D,
+                                   float diff,
+                                   float idx2, float idy2, float idz2,
+                                   float dt)
+{
+    __shared__ float tile[TY+2][TX+2];
+
+    const int k = blockIdx.x*TX + threadIdx.x;
+    const int j = blockIdx.y*TY + threadIdx.y;
+    const int tx = threadIdx.x + 1;
+    const int ty = threadIdx.y + 1;
+    const bool active = (k < D) && (j < H);
+
+    const int j_m = max(j-1, 0);
+    const int j_p = min(j+1, H-1);
+    const int k_m = max(k-1, 0);
+    const int k_p = min(k+1, D-1);
+    const long sx = (long)H * (long)D;
+
+    /* stream along i with three register-resident u planes */
+    float4 q;
+    float u_im1 = 0.0f, u_i = 0.0f, u_ip1 = 0.0f;
+    if (active) {
+        q     = in[(long)j*D + k];
+        u_i   = q.x;
+        u_im1 = u_i;                      /* i-1 clamped onto i=0 */
+    }
+
+    float4 q_next;
+    for (int i = 0; i < W; ++i) {
+        const long base = (long)i*sx;
+        if (active) {
+            if (i < W-1) {
+                q_next = in[base + sx + (long)j*D + k];
+                u_ip1  = q_next.x;
+            } else {
+                u_ip1  = u_i;         /* i+1 clamped onto i=W-1 */
+            }
+            /* current plane of u in shared memory for in-plane neighbours */
+            tile[ty][tx] = u_i;
+            if (threadIdx.y == 0)    tile[0][tx]    = in[base + (long)j_m*D + k].x;
+            if (threadIdx.y == TY-1 || j == H-1)
+                                     tile[ty+1][tx] = in[base + (long)j_p*D + k].x;
+            if (threadIdx.x == 0)    tile[ty][0]    = in[base + (long)j*D + k_m].x;
+            if (threadIdx.x == TX-1 || k == D-1)
+                                     tile[ty][tx+1] = in[base + (long)j*D + k_p].x;
+        }
+        __syncthreads();
+        if (active) {
+            const float lapla = (u_im1     - 2.0f*u_i + u_ip1)*idx2
+                              + (tile[ty-1][tx] - 2.0f*u_i + tile[ty+1][tx])*idy2
+                              + (tile[ty][tx-1] - 2.0f*u_i + tile[ty][tx+1])*idz2;
+            out[base + (long)j*D + k] = fenton_voxel(q, lapla, diff, dt);
+            /* shift the register planes onto the next i */
+            u_im1 = u_i;
+            u_i   = u_ip1;
+            q     = q_next;
+        }
+        __syncthreads();
+    }
+}
+
+using namespace tensorflow;
+
+REGISTER_OP("FentonStep")
+    .Input("state: float32")
+    .Output("new_state: float32")
+    .Attr("diff: float")
+    .Attr("dx: float")
+    .Attr("dy: float")
+    .Attr("dz: float")
+    .Attr("dt: float")
+    .SetShapeFn(shape_inference::UnchangedShape);
+
+class FentonStepOp : public OpKernel {
+ public:
+    explicit FentonStepOp(OpKernelConstruction* ctx) : OpKernel(ctx) {
+        OP_REQUIRES_OK(ctx, ctx->GetAttr("diff", &diff_));
+        OP_REQUIRES_OK(ctx, ctx->GetAttr("dx", &dx_));
+        OP_REQUIRES_OK(ctx, ctx->GetAttr("dy", &dy_));
+        OP_REQUIRES_OK(ctx, ctx->GetAttr("dz", &dz_));
+        OP_REQUIRES_OK(ctx, ctx->GetAttr("dt", &dt_));
+    }
+
+    void Compute(OpKernelContext* ctx) override {
+        const Tensor& state = ctx->input(0);
+        OP_REQUIRES(ctx, state.dims() == 4 && state.dim_size(3) == 4,
+                    errors::InvalidArgument("state must have shape [W,H,D,4]"));
+        Tensor* out = nullptr;
+        OP_REQUIRES_OK(ctx, ctx->allocate_output(0, state.shape(), &out));
+        const int W = state.dim_size(0);
+        const int H = state.dim_size(1);
+        const int D = state.dim_size(2);
+        const dim3 block(TX, TY);
+        const dim3 grid((D + TX - 1)/TX, (H + TY - 1)/TY);
+        const auto& stream = ctx->eigen_device<Eigen::GpuDevice>().stream();
+        fenton_step_kernel<<<grid, block, 0, stream>>>(
+            reinterpret_cast<const float4*>(state.flat<float>().data()),
+            reinterpret_cast<float4*>(out->flat<float>().data()),
+            W, H, D, diff_,
+            1.0f/(dx_*dx_), 1.0f/(dy_*dy_), 1.0f/(dz_*dz_), dt_);
+    }
+
+ private:
+    float diff_, dx_, dy_, dz_, dt_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("FentonStep").Device(DEVICE_GPU), FentonStepOp);
@@ -6,6 +6,8 @@ Contains:
   * laplace_heterogeneous_anisotropic_diffusion: 3D laplace solver for heterogeneous anisotropic diffusion
   * laplace_homogeneous_isotropic_diffusion:     3D laplace solver for homogeneous isotropic diffusion
   * laplace_convolution_homogeneous_isotropic_diffusion: 3D laplace operator as a convolution layer
+  * laplace_cext: SIMD (AVX2) C kernel for the heterogeneous isotropic laplace operator on NumPy
+    arrays (not imported by default; requires a C compiler on the first import)
 
 """
 import tensorflow as tf
@@ -1,36 +1,48 @@
 import tensorflow as tf
 
 @tf.function
-def laplace_heterogeneous_isotropic_diffusion(X0,DIFF0,DX,DY,DZ):
+def laplace_heterogeneous_isotropic_diffusion(X,DIFF,DX,DY,DZ):
     """
     This function computes the 3D Laplace operator on X for an heterogeneous isotropic diffusion
-    The diffusion encodes the phase field that describes the domain 
+    The diffusion encodes the phase field that describes the domain
     (e.g., elements outside the domain must have diffusion equal to 0)
-    The boundaries of the 3D cube are extended with a symmetric padding to generate a non-flux b.c.
+    The no-flux (Neumann) boundary condition is obtained by clamping the neighbour
+    indices at the borders (equivalent to a symmetric padding) rather than
+    materialising padded copies of X and DIFF.
     Input:
-        X0:       the (tensor) variable one wants to compute the laplace operator
-        DIFF0:    the (tensor of the) conductivity values
+        X:        the (tensor) variable one wants to compute the laplace operator
+        DIFF:     the (tensor of the) conductivity values
         D{X,Y,Z}: the element sizes along the 3 directions
-    Output: 
+    Output:
         The tensor with the laplace operator values
-    
+
     """
-    padmode = 'symmetric'
-    paddings = tf.constant([[1,1], [1,1], [1,1]])
-    X    = tf.pad(X0, paddings=paddings, mode=padmode) 
-    DIFF = tf.pad(DIFF0, paddings=paddings, mode=padmode) 
+    # neighbours along each direction, with the index clamped at the borders
+    Xxm = tf.concat([X[:1,:,:],  X[:-1,:,:]], axis=0)
+    Xxp = tf.concat([X[1:,:,:],  X[-1:,:,:]], axis=0)
+    Xym = tf.concat([X[:,:1,:],  X[:,:-1,:]], axis=1)
+    Xyp = tf.concat([X[:,1:,:],  X[:,-1:,:]], axis=1)
+    Xzm = tf.concat([X[:,:,:1],  X[:,:,:-1]], axis=2)
+    Xzp = tf.concat([X[:,:,1:],  X[:,:,-1:]], axis=2)
+
+    Dxm = tf.concat([DIFF[:1,:,:],  DIFF[:-1,:,:]], axis=0)
+    Dxp = tf.concat([DIFF[1:,:,:],  DIFF[-1:,:,:]], axis=0)
+    Dym = tf.concat([DIFF[:,:1,:],  DIFF[:,:-1,:]], axis=1)
+    Dyp = tf.concat([DIFF[:,1:,:],  DIFF[:,-1:,:]], axis=1)
+    Dzm = tf.concat([DIFF[:,:,:1],  DIFF[:,:,:-1]], axis=2)
+    Dzp = tf.concat([DIFF[:,:,1:],  DIFF[:,:,-1:]], axis=2)
+
     # Gx
-    eGrad =  0.5*( DIFF[2:,1:-1,1:-1]   + DIFF[1:-1, 1:-1,1:-1] )* (X[2:,1:-1,1:-1]   - X[1:-1, 1:-1,1:-1] )
-    wGrad = -0.5*( DIFF[0:-2,1:-1,1:-1] + DIFF[1:-1, 1:-1,1:-1] )* (X[0:-2,1:-1,1:-1] - X[1:-1, 1:-1,1:-1] )
+    eGrad =  0.5*( Dxp + DIFF )* (Xxp - X )
+    wGrad = -0.5*( Dxm + DIFF )* (Xxm - X )
     # Gy
-    nGrad =  0.5*( DIFF[1:-1,2:,1:-1] + DIFF[1:-1, 1:-1,1:-1]   )* (X[1:-1,2:,1:-1]   - X[1:-1, 1:-1,1:-1] )
-    sGrad = -0.5*( DIFF[1:-1,0:-2,1:-1] + DIFF[1:-1, 1:-1,1:-1] )* (X[1:-1,0:-2,1:-1] - X[1:-1, 1:-1,1:-1] )
-    # Gz    
-    uGrad =  0.5*( DIFF[1:-1,1:-1,2:] + DIFF[1:-1, 1:-1,1:-1]   )* (X[1:-1,1:-1,2:]   - X[1:-1, 1:-1,1:-1] )
-    dGrad = -0.5*( DIFF[1:-1,1:-1,0:-2] + DIFF[1:-1, 1:-1,1:-1] )* (X[1:-1,1:-1,0:-2] - X[1:-1, 1:-1,1:-1] )
+    nGrad =  0.5*( Dyp + DIFF )* (Xyp - X )
+    sGrad = -0.5*( Dym + DIFF )* (Xym - X )
+    # Gz
+    uGrad =  0.5*( Dzp + DIFF )* (Xzp - X )
+    dGrad = -0.5*( Dzm + DIFF )* (Xzm - X )
     dxsq = DX*DX
     dysq = DY*DY
     dzsq = DZ*DZ
     lapla = (eGrad - wGrad)/dxsq + (nGrad - sGrad)/dysq  + (uGrad - dGrad)/dzsq
     return lapla
-
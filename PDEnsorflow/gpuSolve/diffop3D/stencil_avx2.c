@@ -0,0 +1,103 @@
+/*
+ * stencil_avx2.c
+ *
+ * Hand-vectorised 7-point stencil for the heterogeneous isotropic
+ * Laplace operator on a C-contiguous [W,H,D] float32 grid.
+ * The innermost (contiguous) z axis is processed 8 voxels at a time
+ * with AVX2/FMA loads; the boundary voxels of each row are handled with
+ * scalar code. The no-flux (Neumann) boundary condition is obtained by
+ * clamping the neighbour indices at the borders, the same discretisation
+ * as gpuSolve.diffop3D.laplace_heterog.
+ *
+ * Build (see laplace_cext.py, which does this on first import):
+ *   cc -O3 -mavx2 -mfma -fPIC -shared stencil_avx2.c -o _stencil_avx2.so
+ */
+
+#include <stddef.h>
+
+#ifdef __AVX2__
+#include <immintrin.h>
+#endif
+
+/* one voxel of the clamped 7-point heterogeneous stencil; the offsets
+ * are relative to the current voxel and already clamped by the caller */
+static inline float lap7(const float *x, const float *c,
+                         ptrdiff_t xm, ptrdiff_t xp,
+                         ptrdiff_t ym, ptrdiff_t yp,
+                         ptrdiff_t zm, ptrdiff_t zp,
+                         float idx2, float idy2, float idz2)
+{
+    const float u = x[0];
+    const float d = c[0];
+    const float gx = 0.5f*((c[xp] + d)*(x[xp] - u) + (c[xm] + d)*(x[xm] - u));
+    const float gy = 0.5f*((c[yp] + d)*(x[yp] - u) + (c[ym] + d)*(x[ym] - u));
+    const float gz = 0.5f*((c[zp] + d)*(x[zp] - u) + (c[zm] + d)*(x[zm] - u));
+    return gx*idx2 + gy*idy2 + gz*idz2;
+}
+
+void laplace7_f32(const float *X, const float *C, float *L,
+                  int W, int H, int D,
+                  float idx2, float idy2, float idz2)
+{
+    const ptrdiff_t sx = (ptrdiff_t)H * (ptrdiff_t)D;
+    const ptrdiff_t sy = (ptrdiff_t)D;
+
+#ifdef __AVX2__
+    const __m256 half = _mm256_set1_ps(0.5f);
+    const __m256 vix2 = _mm256_set1_ps(idx2);
+    const __m256 viy2 = _mm256_set1_ps(idy2);
+    const __m256 viz2 = _mm256_set1_ps(idz2);
+#endif
+
+    for (int i = 0; i < W; ++i) {
+        const ptrdiff_t xm = (i > 0)     ? -sx : 0;
+        const ptrdiff_t xp = (i < W - 1) ?  sx : 0;
+        for (int j = 0; j < H; ++j) {
+            const ptrdiff_t ym = (j > 0)     ? -sy : 0;
+            const ptrdiff_t yp = (j < H - 1) ?  sy : 0;
+            const float *x = X + i*sx + j*sy;
+            const float *c = C + i*sx + j*sy;
+            float       *l = L + i*sx + j*sy;
+
+            /* k = 0: the z- neighbour is clamped onto the voxel itself */
+            l[0] = lap7(x, c, xm, xp, ym, yp, 0, (D > 1) ? 1 : 0,
+                        idx2, idy2, idz2);
+
+            int k = 1;
+#ifdef __AVX2__
+            for (; k + 8 <= D - 1; k += 8) {
+                const __m256 u  = _mm256_loadu_ps(x + k);
+                const __m256 d  = _mm256_loadu_ps(c + k);
+                const __m256 gx = _mm256_mul_ps(half, _mm256_add_ps(
+                    _mm256_mul_ps(_mm256_add_ps(_mm256_loadu_ps(c + k + xp), d),
+                                  _mm256_sub_ps(_mm256_loadu_ps(x + k + xp), u)),
+                    _mm256_mul_ps(_mm256_add_ps(_mm256_loadu_ps(c + k + xm), d),
+                                  _mm256_sub_ps(_mm256_loadu_ps(x + k + xm), u))));
+                const __m256 gy = _mm256_mul_ps(half, _mm256_add_ps(
+                    _mm256_mul_ps(_mm256_add_ps(_mm256_loadu_ps(c + k + yp), d),
+                                  _mm256_sub_ps(_mm256_loadu_ps(x + k + yp), u)),
+                    _mm256_mul_ps(_mm256_add_ps(_mm256_loadu_ps(c + k + ym), d),
+                                  _mm256_sub_ps(_mm256_loadu_ps(x + k + ym), u))));
+                const __m256 gz = _mm256_mul_ps(half, _mm256_add_ps(
+                    _mm256_mul_ps(_mm256_add_ps(_mm256_loadu_ps(c + k + 1), d),
+                                  _mm256_sub_ps(_mm256_loadu_ps(x + k + 1), u)),
+                    _mm256_mul_ps(_mm256_add_ps(_mm256_loadu_ps(c + k - 1), d),
+                                  _mm256_sub_ps(_mm256_loadu_ps(x + k - 1), u))));
+                __m256 lap = _mm256_mul_ps(gx, vix2);
+                lap = _mm256_fmadd_ps(gy, viy2, lap);
+                lap = _mm256_fmadd_ps(gz, viz2, lap);
+                _mm256_storeu_ps(l + k, lap);
+            }
+#endif
+            /* scalar remainder of the interior */
+            for (; k < D - 1; ++k)
+                l[k] = lap7(x + k, c + k, xm, xp, ym, yp, -1, 1,
+                            idx2, idy2, idz2);
+
+            /* k = D-1: the z+ neighbour is clamped onto the voxel itself */
+            if (D > 1)
+                l[D-1] = lap7(x + D - 1, c + D - 1, xm, xp, ym, yp, -1, 0,
+                              idx2, idy2, idz2);
+        }
+    }
+}
@@ -2,8 +2,10 @@
 ionic submodule of gpuSolve.
 This module contains the 0D ionic models
 Contains:
-    * fenton4v:  the 4 variables Fenton model
-    * mms2v.py:  the 2 cariables modified Mitchell Schaeffer model
+    * fenton4v:       the 4 variables Fenton model
+    * mms2v.py:       the 2 cariables modified Mitchell Schaeffer model
+    * fenton_kernel:  a fused Numba CPU kernel for the Fenton model (optional, requires numba)
+    * fenton4v_np:    the numpy counterpart of the fenton4v model for CPU drivers
 """
 
 
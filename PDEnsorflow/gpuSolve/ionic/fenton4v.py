@@ -31,7 +31,6 @@ import time
 
 
 import tensorflow as tf
-tf.config.run_functions_eagerly(True)
 
 
 
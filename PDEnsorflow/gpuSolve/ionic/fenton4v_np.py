@@ -0,0 +1,58 @@
+"""
+Vectorised numpy implementation of the Fenton 4v ionic model.
+This module mirrors gpuSolve.ionic.fenton4v on plain numpy arrays, for
+CPU drivers that keep the state out of tensorflow (e.g. paired with the
+SIMD C stencil of gpuSolve.diffop3D.laplace_cext); the constants and
+the step functions are the same as in the tensorflow model.
+Contains:
+    * H, G:          the step functions
+    * differentiate: the state differentiation for the 4v model
+"""
+
+import numpy as np
+
+
+def H(x):
+    """ the step function """
+    return (1.0 + np.sign(x)) * 0.5
+
+
+def G(x):
+    """ the step function """
+    return (1.0 - np.sign(x)) * 0.5
+
+
+def differentiate(U, V, W, S):
+    """ the state differentiation for the 4v model """
+    # constants for the Fenton 4v left atrial action potential model
+    tau_vp  = 3.33
+    tau_vn  = 19.2
+    tau_wp  = 160.0
+    tau_wn1 = 75.0
+    tau_wn2 = 75.0
+    tau_d   = 0.065
+    tau_si  = 31.8364
+    tau_so  = tau_si
+    tau_a   = 0.009
+    u_c     = 0.23
+    u_w     = 0.146
+    u_0     = 0.0
+    u_m     = 1.0
+    u_csi   = 0.8
+    u_so    = 0.3
+    r_sp    = 0.02
+    r_sn    = 1.2
+    k_      = 3.0
+    a_so    = 0.115
+    b_so    = 0.84
+    c_so    = 0.02
+    I_fi = -V * H(U - u_c) * (U - u_c) * (u_m - U) / tau_d
+    I_si = -W * S / tau_si
+    I_so = (0.5 * (a_so - tau_a) * (1 + np.tanh((U - b_so) / c_so)) +
+           (U - u_0) * G(U - u_so) / tau_so + H(U - u_so) * tau_a)
+    dU = -(I_fi + I_si + I_so)
+    dV = np.where(U > u_c, -V / tau_vp, (1 - V) / tau_vn)
+    dW = np.where(U > u_c, -W / tau_wp, np.where(U > u_w, (1 - W) / tau_wn2, (1 - W) / tau_wn1))
+    r_s = (r_sp - r_sn) * H(U - u_c) + r_sn
+    dS = r_s * (0.5 * (1 + np.tanh((U - u_csi) * k_)) - S)
+    return dU, dV, dW, dS
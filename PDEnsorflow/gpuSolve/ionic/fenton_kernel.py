@@ -0,0 +1,216 @@
+"""
+Fused Numba CPU kernels for the Fenton 4v monodomain model.
+This module compiles the 7-point Laplace operator and the Fenton-Cherry
+ionic update into a single pass over the 3D grid, parallelised over the
+outermost axis with numba.prange. It is meant as a fast CPU alternative
+to the tensorflow solver, where the stencil path is bandwidth-bound.
+The no-flux (Neumann) boundary condition is obtained by clamping the
+neighbour indices at the borders.
+Contains:
+    * fenton_step:       one fused explicit Euler step over the grid
+    * fenton_step_block: several steps with overlapped (temporal) 3D tiling
+numba is an optional dependency: importing this module raises
+ImportError when it is not installed.
+"""
+
+import math
+import numpy as np
+from numba import njit, prange
+
+
+@njit(inline='always')
+def _H(x):
+    """ the step function """
+    if x > 0.0:
+        return 1.0
+    elif x < 0.0:
+        return 0.0
+    return 0.5
+
+
+@njit(inline='always')
+def _G(x):
+    """ the step function """
+    if x < 0.0:
+        return 1.0
+    elif x > 0.0:
+        return 0.0
+    return 0.5
+
+
+@njit(inline='always')
+def _step_voxel(U, V, W, S, i, j, k, i_m, i_p, j_m, j_p, k_m, k_p,
+                diff, idx2, idy2, idz2, dt):
+    """
+    The fused update of one voxel: 7-point Laplace operator plus the
+    Fenton 4v ionic model; the neighbour indices are already clamped by
+    the caller. Returns the new (u,v,w,s) values.
+    """
+    # constants for the Fenton 4v left atrial action potential model
+    tau_vp  = 3.33
+    tau_vn  = 19.2
+    tau_wp  = 160.0
+    tau_wn1 = 75.0
+    tau_wn2 = 75.0
+    tau_d   = 0.065
+    tau_si  = 31.8364
+    tau_so  = tau_si
+    tau_a   = 0.009
+    u_c     = 0.23
+    u_w     = 0.146
+    u_0     = 0.0
+    u_m     = 1.0
+    u_csi   = 0.8
+    u_so    = 0.3
+    r_sp    = 0.02
+    r_sn    = 1.2
+    k_      = 3.0
+    a_so    = 0.115
+    b_so    = 0.84
+    c_so    = 0.02
+
+    u = U[i,j,k]
+    v = V[i,j,k]
+    w = W[i,j,k]
+    s = S[i,j,k]
+    lapla = ((U[i_m,j,k] - 2.0*u + U[i_p,j,k])*idx2
+           + (U[i,j_m,k] - 2.0*u + U[i,j_p,k])*idy2
+           + (U[i,j,k_m] - 2.0*u + U[i,j,k_p])*idz2)
+    I_fi = -v * _H(u - u_c) * (u - u_c) * (u_m - u) / tau_d
+    I_si = -w * s / tau_si
+    I_so = (0.5 * (a_so - tau_a) * (1.0 + math.tanh((u - b_so) / c_so)) +
+           (u - u_0) * _G(u - u_so) / tau_so + _H(u - u_so) * tau_a)
+    du = -(I_fi + I_si + I_so)
+    if u > u_c:
+        dv = -v / tau_vp
+    else:
+        dv = (1.0 - v) / tau_vn
+    if u > u_c:
+        dw = -w / tau_wp
+    elif u > u_w:
+        dw = (1.0 - w) / tau_wn2
+    else:
+        dw = (1.0 - w) / tau_wn1
+    r_s = (r_sp - r_sn) * _H(u - u_c) + r_sn
+    ds = r_s * (0.5 * (1.0 + math.tanh((u - u_csi) * k_)) - s)
+    return u + dt*du + diff*dt*lapla, v + dt*dv, w + dt*dw, s + dt*ds
+
+
+@njit(parallel=True, fastmath=True, boundscheck=False)
+def fenton_step(U, V, W, S, diff, DX, DY, DZ, dt, U1, V1, W1, S1):
+    """
+    One explicit Euler step of the Fenton 4v monodomain model with
+    homogeneous isotropic diffusion, fused in a single grid sweep.
+    Input:
+        U,V,W,S:     the state variables (3D numpy arrays)
+        diff:        the (scalar) diffusion coefficient
+        D{X,Y,Z}:    the element sizes along the 3 directions
+        dt:          the time step
+        U1,V1,W1,S1: output arrays where the new state is written
+    """
+    width, height, depth = U.shape
+    idx2 = 1.0/(DX*DX)
+    idy2 = 1.0/(DY*DY)
+    idz2 = 1.0/(DZ*DZ)
+
+    for i in prange(width):
+        i_m = max(i-1, 0)
+        i_p = min(i+1, width-1)
+        for j in range(height):
+            j_m = max(j-1, 0)
+            j_p = min(j+1, height-1)
+            for k in range(depth):
+                k_m = max(k-1, 0)
+                k_p = min(k+1, depth-1)
+                U1[i,j,k], V1[i,j,k], W1[i,j,k], S1[i,j,k] = _step_voxel(
+                    U, V, W, S, i, j, k, i_m, i_p, j_m, j_p, k_m, k_p,
+                    diff, idx2, idy2, idz2, dt)
+
+
+@njit(parallel=True, fastmath=True, boundscheck=False)
+def fenton_step_block(U, V, W, S, diff, DX, DY, DZ, dt, nsteps, tile,
+                      U1, V1, W1, S1):
+    """
+    nsteps explicit Euler steps with overlapped (temporal) 3D tiling:
+    every tile of the grid is copied into a local scratch buffer with an
+    nsteps-deep halo and advanced nsteps times before moving on, so the
+    state of a tile crosses DRAM once per nsteps steps instead of once
+    per step. The halo voxels are recomputed redundantly by neighbouring
+    tiles; the result is identical to calling fenton_step nsteps times.
+    Input:
+        U,V,W,S:     the state variables (3D numpy arrays)
+        diff:        the (scalar) diffusion coefficient
+        D{X,Y,Z}:    the element sizes along the 3 directions
+        dt:          the time step
+        nsteps:      the number of sub-steps to take (also the halo depth)
+        tile:        the tile edge length
+        U1,V1,W1,S1: output arrays where the state after nsteps is written
+    """
+    width, height, depth = U.shape
+    idx2 = 1.0/(DX*DX)
+    idy2 = 1.0/(DY*DY)
+    idz2 = 1.0/(DZ*DZ)
+    ntx = (width  + tile - 1)//tile
+    nty = (height + tile - 1)//tile
+    ntz = (depth  + tile - 1)//tile
+
+    for t in prange(ntx*nty*ntz):
+        tx = t//(nty*ntz)
+        ty = (t//ntz) % nty
+        tz = t % ntz
+        i0 = tx*tile
+        j0 = ty*tile
+        k0 = tz*tile
+        i1 = min(i0+tile, width)
+        j1 = min(j0+tile, height)
+        k1 = min(k0+tile, depth)
+        # tile bounds extended with the halo, clamped to the grid
+        gi0 = max(i0-nsteps, 0)
+        gj0 = max(j0-nsteps, 0)
+        gk0 = max(k0-nsteps, 0)
+        gi1 = min(i1+nsteps, width)
+        gj1 = min(j1+nsteps, height)
+        gk1 = min(k1+nsteps, depth)
+        bw = gi1-gi0
+        bh = gj1-gj0
+        bd = gk1-gk0
+
+        Au = U[gi0:gi1, gj0:gj1, gk0:gk1].copy()
+        Av = V[gi0:gi1, gj0:gj1, gk0:gk1].copy()
+        Aw = W[gi0:gi1, gj0:gj1, gk0:gk1].copy()
+        As = S[gi0:gi1, gj0:gj1, gk0:gk1].copy()
+        Bu = np.empty_like(Au)
+        Bv = np.empty_like(Av)
+        Bw = np.empty_like(Aw)
+        Bs = np.empty_like(As)
+
+        for step in range(nsteps):
+            # on the sides cut by the halo the valid region shrinks by one
+            # layer per sub-step; domain borders keep the clamped stencil
+            li0 = step+1 if gi0 > 0 else 0
+            lj0 = step+1 if gj0 > 0 else 0
+            lk0 = step+1 if gk0 > 0 else 0
+            li1 = bw-(step+1) if gi1 < width  else bw
+            lj1 = bh-(step+1) if gj1 < height else bh
+            lk1 = bd-(step+1) if gk1 < depth  else bd
+            for i in range(li0, li1):
+                i_m = max(i-1, 0)
+                i_p = min(i+1, bw-1)
+                for j in range(lj0, lj1):
+                    j_m = max(j-1, 0)
+                    j_p = min(j+1, bh-1)
+                    for k in range(lk0, lk1):
+                        k_m = max(k-1, 0)
+                        k_p = min(k+1, bd-1)
+                        Bu[i,j,k], Bv[i,j,k], Bw[i,j,k], Bs[i,j,k] = _step_voxel(
+                            Au, Av, Aw, As, i, j, k, i_m, i_p, j_m, j_p, k_m, k_p,
+                            diff, idx2, idy2, idz2, dt)
+            Au, Bu = Bu, Au
+            Av, Bv = Bv, Av
+            Aw, Bw = Bw, Aw
+            As, Bs = Bs, As
+
+        U1[i0:i1, j0:j1, k0:k1] = Au[i0-gi0:i1-gi0, j0-gj0:j1-gj0, k0-gk0:k1-gk0]
+        V1[i0:i1, j0:j1, k0:k1] = Av[i0-gi0:i1-gi0, j0-gj0:j1-gj0, k0-gk0:k1-gk0]
+        W1[i0:i1, j0:j1, k0:k1] = Aw[i0-gi0:i1-gi0, j0-gj0:j1-gj0, k0-gk0:k1-gk0]
+        S1[i0:i1, j0:j1, k0:k1] = As[i0-gi0:i1-gi0, j0-gj0:j1-gj0, k0-gk0:k1-gk0]